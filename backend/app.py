@@ -6,27 +6,41 @@ import jwt
 from flask_cors import CORS
 import json
 import os
+import time
+import threading
 from datetime import datetime
 from config import Config
 from knowledge_manager_simple import KnowledgeBaseManager
 from llm_integration import TinyLLaMAIntegration
+import response_layer
+from response_layer import cached_json_response
+from query_log import query_logger, is_replay_session
+from shared_state import SharedState, ChatHistory
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
 config = Config()
 config.init_app(app)
+response_layer.init_app(app)
 
 # Initialize components
 knowledge_manager = KnowledgeBaseManager()
 llm_integration = TinyLLaMAIntegration()
 
-# Conversation history storage
-conversation_history = {}
 disabled_categories = set()
 # New structured category settings: {category: {enabled: bool, message: str}}
 category_settings = {}
 
+# Admin state shared by all worker processes; the globals above are this
+# process's copy, refreshed by sync_shared_state when the store's version moves
+shared_state = SharedState(config.SHARED_STATE_PATH)
+# Conversation history storage, also shared so admin views cover every worker
+conversation_history = ChatHistory(shared_state, max_rows=config.CHAT_HISTORY_MAX_ROWS)
+shared_state_lock = threading.Lock()
+synced_state_version = None
+synced_kb_generation = 0
+
 # Category to department mapping for analytics
 CATEGORY_TO_DEPT = {
     'fixed_qa': 'General',
@@ -73,6 +87,29 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated
 
+@app.before_request
+def sync_shared_state():
+    """Pick up admin changes made by other workers; one tiny read when nothing changed"""
+    global category_settings, disabled_categories, synced_state_version, synced_kb_generation
+    if shared_state.version() == synced_state_version:
+        return
+    with shared_state_lock:
+        version, values = shared_state.load()
+        if version == synced_state_version:
+            return
+        category_settings = values.get('category_settings', {})
+        disabled_categories = set(values.get('disabled_categories', []))
+        kb_generation = values.get('kb_generation', 0)
+        if kb_generation != synced_kb_generation:
+            # Only files whose size/mtime changed are re-read
+            knowledge_manager.load_knowledge_base()
+            synced_kb_generation = kb_generation
+        synced_state_version = version
+
+def publish_kb_change():
+    """Tell the other workers to reload changed knowledge base files"""
+    shared_state.increment('kb_generation')
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -101,61 +138,76 @@ def admin_logout():
     # For JWTs there is no server-side session to destroy; client drops token
     return jsonify({'success': True})
 
+def knowledge_base_signature():
+    """Cheap version of the knowledge_base folder (file names, sizes, mtimes)"""
+    knowledge_base_path = os.path.join(os.path.dirname(__file__), 'knowledge_base')
+    entries = []
+    for entry in os.scandir(knowledge_base_path):
+        if entry.name.endswith('.json'):
+            stat = entry.stat()
+            entries.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(entries))
+
+def build_knowledge_base_payload():
+    """Collect all questions from knowledge base files"""
+    knowledge_base_path = os.path.join(os.path.dirname(__file__), 'knowledge_base')
+    questions_data = []
+    
+    # Map file names to departments
+    department_mapping = {
+        'fixed_qa.json': 'General',
+        'benefits.json': 'HR',
+        'code_of_conduct.json': 'HR',
+        'leave_policy.json': 'HR',
+        'hr_contacts.json': 'HR',
+        'company_overview.json': 'General',
+        'company_timings.json': 'HR',
+        'it_support.json': 'IT',
+        'it_tools.json': 'IT',
+        'department_info.json': 'General',
+        'departments.json': 'General',
+        'company_policies.json': 'HR',
+        'onboarding_training.json': 'HR'
+    }
+    
+    # Read all JSON files in knowledge_base folder
+    for filename in os.listdir(knowledge_base_path):
+        if filename.endswith('.json'):
+            file_path = os.path.join(knowledge_base_path, filename)
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    
+                department = department_mapping.get(filename, 'General')
+                
+                # Process each question in the file
+                for i, item in enumerate(data):
+                    if isinstance(item, dict) and 'question' in item:
+                        questions_data.append({
+                            'id': f"{filename}_{i}",
+                            'question': item['question'],
+                            'answer': item.get('answer', ''),
+                            'department': department,
+                            'category': filename.replace('.json', '').replace('_', ' ').title(),
+                            'timestamp': datetime.now().isoformat(),
+                            'source_file': filename
+                        })
+            except Exception as e:
+                print(f"Error reading {filename}: {e}")
+                continue
+    
+    return {
+        'success': True,
+        'questions': questions_data,
+        'total_count': len(questions_data)
+    }
+
 @app.route('/api/knowledge-base', methods=['GET'])
 def get_knowledge_base():
     """Get all questions from knowledge base files"""
     try:
-        knowledge_base_path = os.path.join(os.path.dirname(__file__), 'knowledge_base')
-        questions_data = []
-        
-        # Map file names to departments
-        department_mapping = {
-            'fixed_qa.json': 'General',
-            'benefits.json': 'HR',
-            'code_of_conduct.json': 'HR',
-            'leave_policy.json': 'HR',
-            'hr_contacts.json': 'HR',
-            'company_overview.json': 'General',
-            'company_timings.json': 'HR',
-            'it_support.json': 'IT',
-            'it_tools.json': 'IT',
-            'department_info.json': 'General',
-            'departments.json': 'General',
-            'company_policies.json': 'HR',
-            'onboarding_training.json': 'HR'
-        }
-        
-        # Read all JSON files in knowledge_base folder
-        for filename in os.listdir(knowledge_base_path):
-            if filename.endswith('.json'):
-                file_path = os.path.join(knowledge_base_path, filename)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        
-                    department = department_mapping.get(filename, 'General')
-                    
-                    # Process each question in the file
-                    for i, item in enumerate(data):
-                        if isinstance(item, dict) and 'question' in item:
-                            questions_data.append({
-                                'id': f"{filename}_{i}",
-                                'question': item['question'],
-                                'answer': item.get('answer', ''),
-                                'department': department,
-                                'category': filename.replace('.json', '').replace('_', ' ').title(),
-                                'timestamp': datetime.now().isoformat(),
-                                'source_file': filename
-                            })
-                except Exception as e:
-                    print(f"Error reading {filename}: {e}")
-                    continue
-        
-        return jsonify({
-            'success': True,
-            'questions': questions_data,
-            'total_count': len(questions_data)
-        })
+        # Served from the precompressed cache until a knowledge base file changes
+        return cached_json_response('knowledge-base', knowledge_base_signature(), build_knowledge_base_payload)
         
     except Exception as e:
         return jsonify({
@@ -163,6 +215,108 @@ def get_knowledge_base():
             'error': str(e)
         }), 500
 
+def get_disabled_categories():
+    """Categories switched off in the admin category settings"""
+    return {cat for cat, cs in category_settings.items() if cs.get('enabled') is False}
+
+def request_scope(data):
+    """The optional category/department filter sent with a chat request, or None if malformed"""
+    scope = {key: data[key] for key in ('category', 'department') if data.get(key)}
+    if any(not isinstance(value, str) for value in scope.values()):
+        return None
+    return scope
+
+INVALID_SCOPE_ERROR = 'category and department must be strings'
+
+def resolve_search_scope(category=None, department=None):
+    """Categories to search for an optional category/department filter (None = all)"""
+    if category:
+        return [category]
+    if department:
+        return [cat for cat in knowledge_manager.get_all_categories() if CATEGORY_TO_DEPT.get(cat, 'General') == department]
+    return None
+
+def start_chat_turn(question: str, session_id: str, categories=None):
+    """Record the user message and look up context.
+
+    Returns (context, match_type, category, hits, retrieval_ms), where
+    retrieval_ms times the knowledge base search alone. categories optionally
+    limits the search to those knowledge base partitions.
+    """
+    # Add question to history (replayed traffic is not a real conversation)
+    if not is_replay_session(session_id):
+        conversation_history.append(session_id, {
+            'type': 'user',
+            'message': question,
+            'timestamp': datetime.now().isoformat()
+        })
+    
+    # Get context and answer; disabled categories are skipped before scoring
+    disabled = get_disabled_categories()
+    started = time.perf_counter()
+    context, match_type, matched_category, hits = knowledge_manager.search_for_question(
+        question, categories=categories, disabled=disabled
+    )
+    return context, match_type, matched_category, hits, (time.perf_counter() - started) * 1000
+
+def finish_chat_turn(session_id: str, context: str, match_type: str, matched_category: str, llm_answer=None):
+    """Pick the answer for a looked-up question, record it and build the response body.
+
+    llm_answer is the generated answer for similarity_search matches (None if the model failed).
+    """
+    if match_type == "exact_match":
+        # Use exact answer
+        answer = context
+        confidence = "high"
+    elif match_type == "similarity_search":
+        # Generated by the LLM with context
+        answer = llm_answer
+        if not answer:
+            answer = "Sorry, I'm having trouble reaching the knowledge model right now. Please try again later or contact HR."
+        confidence = "medium"
+    elif match_type == 'disabled_category':
+        # Use custom message if provided
+        custom_message = (category_settings.get(matched_category) or {}).get('message')
+        answer = custom_message or "This topic is temporarily disabled by the administrator. Please contact HR."
+        confidence = "low"
+    else:
+        # No match found
+        answer = "Sorry, I don't have this information. Please contact HR."
+        confidence = "low"
+    
+    # Add response to history
+    if not is_replay_session(session_id):
+        conversation_history.append(session_id, {
+            'type': 'assistant',
+            'message': answer,
+            'confidence': confidence,
+            'match_type': match_type,
+            'category': matched_category,
+            'timestamp': datetime.now().isoformat()
+        })
+    
+    return {
+        'answer': answer,
+        'confidence': confidence,
+        'match_type': match_type,
+        'category': matched_category,
+        'session_id': session_id,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def log_chat_turn(session_id, question, scope, hits, result, retrieval_ms, started, retrieved, generated):
+    """Append a finished chat turn to the query log (perf_counter timestamps)"""
+    if not query_logger.enabled:
+        return
+    if is_replay_session(session_id):
+        return
+    query_logger.record(
+        session_id, question, scope, get_disabled_categories(), hits, result,
+        retrieval_ms=retrieval_ms,
+        llm_ms=(generated - retrieved) * 1000,
+        total_ms=(time.perf_counter() - started) * 1000
+    )
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Main chat endpoint"""
@@ -170,70 +324,31 @@ def chat():
         data = request.get_json()
         question = data.get('question', '').strip()
         session_id = data.get('session_id', 'default')
+        scope = request_scope(data)
         
         if not question:
             return jsonify({
                 'error': 'No question provided'
             }), 400
+        if scope is None:
+            return jsonify({
+                'error': INVALID_SCOPE_ERROR
+            }), 400
+        categories = resolve_search_scope(**scope)
         
-        # Initialize session history if needed
-        if session_id not in conversation_history:
-            conversation_history[session_id] = []
-        
-        # Add question to history
-        conversation_history[session_id].append({
-            'type': 'user',
-            'message': question,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        # Get context and answer
-        context, match_type, matched_category = knowledge_manager.get_context_for_question(question)
-
-        # Enforce disabled categories via settings
-        settings = category_settings.get(matched_category)
-        if settings and settings.get('enabled') is False:
-            match_type = 'disabled_category'
-            context = ''
+        started = time.perf_counter()
+        context, match_type, matched_category, hits, retrieval_ms = start_chat_turn(question, session_id, categories)
+        retrieved = time.perf_counter()
         
-        if match_type == "exact_match":
-            # Use exact answer
-            answer = context
-            confidence = "high"
-        elif match_type == "similarity_search":
+        llm_answer = None
+        if match_type == "similarity_search":
             # Generate response using LLM with context
-            answer = llm_integration.generate_response(question, context)
-            if not answer:
-                answer = "Sorry, I'm having trouble reaching the knowledge model right now. Please try again later or contact HR."
-            confidence = "medium"
-        elif match_type == 'disabled_category':
-            # Use custom message if provided
-            custom_message = (category_settings.get(matched_category) or {}).get('message')
-            answer = custom_message or "This topic is temporarily disabled by the administrator. Please contact HR."
-            confidence = "low"
-        else:
-            # No match found
-            answer = "Sorry, I don't have this information. Please contact HR."
-            confidence = "low"
-        
-        # Add response to history
-        conversation_history[session_id].append({
-            'type': 'assistant',
-            'message': answer,
-            'confidence': confidence,
-            'match_type': match_type,
-            'category': matched_category,
-            'timestamp': datetime.now().isoformat()
-        })
+            llm_answer = llm_integration.generate_response(question, context)
+        generated = time.perf_counter()
         
-        return jsonify({
-            'answer': answer,
-            'confidence': confidence,
-            'match_type': match_type,
-            'category': matched_category,
-            'session_id': session_id,
-            'timestamp': datetime.now().isoformat()
-        })
+        result = finish_chat_turn(session_id, context, match_type, matched_category, llm_answer)
+        log_chat_turn(session_id, question, scope, hits, result, retrieval_ms, started, retrieved, generated)
+        return jsonify(result)
         
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
@@ -245,16 +360,10 @@ def chat():
 @app.route('/api/history/<session_id>', methods=['GET'])
 def get_history(session_id):
     """Get conversation history for a session"""
-    if session_id in conversation_history:
-        return jsonify({
-            'session_id': session_id,
-            'history': conversation_history[session_id]
-        })
-    else:
-        return jsonify({
-            'session_id': session_id,
-            'history': []
-        })
+    return jsonify({
+        'session_id': session_id,
+        'history': conversation_history.get(session_id)
+    })
 
 # ---------------------- Admin Endpoints ----------------------
 
@@ -264,7 +373,8 @@ def admin_analytics():
     total_questions = 0
     category_counts = {}
     department_counts = {}
-    for history in conversation_history.values():
+    sessions = conversation_history.all()
+    for history in sessions.values():
         for item in history:
             if item.get('type') == 'assistant':
                 total_questions += 1
@@ -276,7 +386,7 @@ def admin_analytics():
     if category_counts:
         most_popular = max(category_counts.items(), key=lambda x: x[1])[0]
     return jsonify({
-        'total_sessions': len(conversation_history),
+        'total_sessions': len(sessions),
         'total_questions': total_questions,
         'category_counts': category_counts,
         'department_counts': department_counts,
@@ -286,7 +396,7 @@ def admin_analytics():
 @app.route('/api/admin/chats', methods=['GET'])
 @admin_required
 def admin_chats():
-    return jsonify(conversation_history)
+    return jsonify(conversation_history.all())
 
 @app.route('/api/admin/chats/reset', methods=['POST'])
 @admin_required
@@ -297,7 +407,7 @@ def admin_chats_reset():
 @app.route('/api/admin/chats/<session_id>', methods=['DELETE'])
 @admin_required
 def admin_chat_delete(session_id):
-    conversation_history.pop(session_id, None)
+    conversation_history.delete(session_id)
     return jsonify({'success': True})
 
 @app.route('/api/admin/policies', methods=['GET', 'PUT'])
@@ -310,6 +420,8 @@ def admin_policies():
     data = request.get_json(silent=True) or []
     with open(file_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    knowledge_manager.reload_category('company_policies')
+    publish_kb_change()
     return jsonify({'success': True})
 
 @app.route('/api/admin/company', methods=['GET', 'PUT'])
@@ -332,6 +444,8 @@ def admin_company():
         fp = os.path.join(base_dir, fn)
         with open(fp, 'w', encoding='utf-8') as f:
             json.dump(content, f, ensure_ascii=False, indent=2)
+        knowledge_manager.reload_category(fn.replace('.json', ''))
+    publish_kb_change()
     return jsonify({'success': True})
 
 @app.route('/api/admin/kb/categories', methods=['GET', 'POST'])
@@ -349,7 +463,8 @@ def admin_kb_categories():
     fp = os.path.join(kb_dir, f"{category}.json")
     with open(fp, 'w', encoding='utf-8') as f:
         json.dump(items, f, ensure_ascii=False, indent=2)
-    knowledge_manager.load_knowledge_base()
+    knowledge_manager.reload_category(category)
+    publish_kb_change()
     return jsonify({'success': True})
 
 @app.route('/api/admin/kb/items', methods=['POST'])
@@ -369,7 +484,8 @@ def admin_kb_add_item():
     items.append(item)
     with open(fp, 'w', encoding='utf-8') as f:
         json.dump(items, f, ensure_ascii=False, indent=2)
-    knowledge_manager.load_knowledge_base()
+    knowledge_manager.reload_category(category)
+    publish_kb_change()
     return jsonify({'success': True})
 
 @app.route('/api/admin/kb/category/<category>', methods=['GET', 'PUT'])
@@ -386,7 +502,8 @@ def admin_kb_category_items(category):
     items = request.get_json(silent=True) or []
     with open(fp, 'w', encoding='utf-8') as f:
         json.dump(items, f, ensure_ascii=False, indent=2)
-    knowledge_manager.load_knowledge_base()
+    knowledge_manager.reload_category(category)
+    publish_kb_change()
     return jsonify({'success': True})
 
 @app.route('/api/admin/kb/category/<category>/<int:index>', methods=['DELETE'])
@@ -403,7 +520,8 @@ def admin_kb_delete_item(category, index):
     items.pop(index)
     with open(fp, 'w', encoding='utf-8') as f:
         json.dump(items, f, ensure_ascii=False, indent=2)
-    knowledge_manager.load_knowledge_base()
+    knowledge_manager.reload_category(category)
+    publish_kb_change()
     return jsonify({'success': True})
 
 @app.route('/api/admin/kb/categories/disabled', methods=['GET', 'PUT'])
@@ -415,6 +533,7 @@ def admin_disabled_categories():
     data = request.get_json(silent=True) or {}
     categories = data.get('disabled', [])
     disabled_categories = set(categories)
+    shared_state.update({'disabled_categories': list(disabled_categories)})
     return jsonify({'success': True, 'disabled': list(disabled_categories)})
 
 @app.route('/api/admin/kb/categories/settings', methods=['GET', 'PUT'])
@@ -440,8 +559,18 @@ def admin_category_settings():
     # Keep legacy disabled_categories in sync
     global disabled_categories
     disabled_categories = { cat for cat, cs in category_settings.items() if cs.get('enabled') is False }
+    shared_state.update({
+        'category_settings': category_settings,
+        'disabled_categories': list(disabled_categories)
+    })
     return jsonify({'success': True})
 
+@app.route('/api/admin/llm/hosts', methods=['GET'])
+@admin_required
+def admin_llm_hosts():
+    """Per-host load, health and latency of the Ollama pool"""
+    return jsonify({'hosts': llm_integration.pool.stats()})
+
 @app.route('/api/categories', methods=['GET'])
 def get_categories():
     """Get all available knowledge base categories"""
@@ -452,14 +581,44 @@ def get_categories():
 @app.route('/api/category/<category_name>', methods=['GET'])
 def get_category_info(category_name):
     """Get information about a specific category"""
-    info = knowledge_manager.get_category_info(category_name)
-    if info:
-        return jsonify(info)
+    if category_name in knowledge_manager.knowledge_base:
+        return cached_json_response(
+            ('category', category_name),
+            knowledge_manager.category_versions.get(category_name),
+            lambda: knowledge_manager.get_category_info(category_name)
+        )
     else:
         return jsonify({
             'error': 'Category not found'
         }), 404
 
+@app.route('/api/search', methods=['GET'])
+def search_knowledge_base():
+    """Search the knowledge base, optionally scoped to one category or department"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({
+            'error': 'No query provided'
+        }), 400
+    
+    category = request.args.get('category')
+    department = request.args.get('department')
+    top_k = request.args.get('top_k', 3, type=int)
+    top_k = max(1, min(top_k, config.MAX_SEARCH_RESULTS))
+    results = knowledge_manager.find_similar_content(
+        query,
+        top_k=top_k,
+        categories=resolve_search_scope(category, department),
+        exclude=get_disabled_categories()
+    )
+    
+    return jsonify({
+        'query': query,
+        'category': category,
+        'department': department,
+        'results': results
+    })
+
 @app.route('/api/suggestions', methods=['GET'])
 def get_suggestions():
     """Get suggested questions for new employees"""
@@ -500,6 +659,8 @@ if __name__ == '__main__':
     print(f"Ollama Status: {llm_integration.test_connection()}")
     print("Server starting on http://localhost:5000")
     
+    # Chat history is on disk only so workers can share it; start empty
+    conversation_history.clear()
     app.run(
         host='0.0.0.0',
         port=5000,
@@ -0,0 +1,112 @@
+# Async Serving Mode
+#
+# Usage: uvicorn asgi:application --host 0.0.0.0 --port 5000
+#
+# POST /api/chat is served by a coroutine that awaits Ollama through a pooled
+# async client, so thousands of chats can wait on the model without holding a
+# thread each. Every other route is passed through to the Flask app unchanged.
+
+import json
+import time
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+import app as backend
+from llm_integration import AsyncTinyLLaMAIntegration
+from response_layer import dumps_bytes
+
+async_llm = None
+
+
+def json_response(payload, status_code: int = 200) -> Response:
+    """Serialize like Flask's jsonify so both modes return identical bodies"""
+    body = dumps_bytes(payload, indent=backend.app.debug) + b"\n"
+    return Response(body, status_code=status_code, media_type='application/json')
+
+
+async def chat(request: Request):
+    """Main chat endpoint (async); same contract as app.chat"""
+    try:
+        # Flask's before_request hooks don't run for this route; the sync may
+        # reload knowledge base files, so keep it off the event loop
+        await run_in_threadpool(backend.sync_shared_state)
+        data = json.loads(await request.body())
+        question = data.get('question', '').strip()
+        session_id = data.get('session_id', 'default')
+        scope = backend.request_scope(data)
+
+        if not question:
+            return json_response({
+                'error': 'No question provided'
+            }, 400)
+        if scope is None:
+            return json_response({
+                'error': backend.INVALID_SCOPE_ERROR
+            }, 400)
+        categories = backend.resolve_search_scope(**scope)
+
+        # Retrieval is ~10 ms of CPU per question; run it in the threadpool so
+        # it doesn't stall the coroutines waiting on Ollama
+        started = time.perf_counter()
+        context, match_type, matched_category, hits, retrieval_ms = await run_in_threadpool(
+            backend.start_chat_turn, question, session_id, categories
+        )
+        retrieved = time.perf_counter()
+
+        llm_answer = None
+        if match_type == "similarity_search":
+            llm_answer = await async_llm.generate_response_async(question, context)
+        generated = time.perf_counter()
+
+        # Both write to disk: the shared chat history and, when enabled, the query log
+        result = await run_in_threadpool(
+            backend.finish_chat_turn, session_id, context, match_type, matched_category, llm_answer
+        )
+        await run_in_threadpool(
+            backend.log_chat_turn, session_id, question, scope, hits, result, retrieval_ms, started, retrieved, generated
+        )
+        return json_response(result)
+
+    except Exception as e:
+        print(f"Error in chat endpoint: {e}")
+        return json_response({
+            'error': 'Internal server error',
+            'message': str(e)
+        }, 500)
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    global async_llm
+    # Share the Flask app's host pool so /api/health and /api/admin/llm/hosts see this traffic
+    async_llm = AsyncTinyLLaMAIntegration(pool=backend.llm_integration.pool)
+    try:
+        yield
+    finally:
+        await async_llm.aclose()
+
+
+chat_app = CORSMiddleware(
+    Starlette(routes=[Route('/api/chat', chat, methods=['POST'])], lifespan=lifespan),
+    allow_origins=['*'],
+    allow_methods=['*'],
+    allow_headers=['*']
+)
+flask_app = WSGIMiddleware(backend.app)
+
+ASYNC_PATHS = {'/api/chat'}
+
+
+async def application(scope, receive, send):
+    """ASGI entry point: async chat path, everything else via Flask"""
+    if scope['type'] == 'lifespan' or scope.get('path') in ASYNC_PATHS:
+        await chat_app(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
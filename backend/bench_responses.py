@@ -0,0 +1,110 @@
+# Response Serialization Benchmark
+#
+# Usage: python bench_responses.py [--iterations N] [--sessions N]
+#
+# For each large endpoint, compares stdlib json against the response layer
+# serializer and reports the body size for identity, gzip and brotli.
+
+import argparse
+import gzip
+import json
+import time
+from datetime import datetime
+
+import app as backend
+import response_layer
+from response_layer import dumps_bytes, compress, available_encodings
+
+
+def build_fake_history(sessions: int, turns: int = 10) -> dict:
+    """Synthetic conversation history shaped like the /api/chat output"""
+    history = {}
+    for s in range(sessions):
+        items = []
+        for t in range(turns):
+            items.append({
+                'type': 'user',
+                'message': f"How many leave days do I get in year {t}?",
+                'timestamp': datetime.now().isoformat()
+            })
+            items.append({
+                'type': 'assistant',
+                'message': "Employees get 24 days of paid leave per year, accrued monthly. " * 3,
+                'confidence': 'medium',
+                'match_type': 'similarity_search',
+                'category': 'leave_policy',
+                'timestamp': datetime.now().isoformat()
+            })
+        history[f"session-{s}"] = items
+    return history
+
+
+def time_call(fn, iterations: int) -> float:
+    """Average milliseconds per call"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def bench_payload(name: str, payload, iterations: int) -> dict:
+    stdlib_ms = time_call(lambda: json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8'), iterations)
+    fast_ms = time_call(lambda: dumps_bytes(payload), iterations)
+    body = dumps_bytes(payload)
+
+    row = {
+        'endpoint': name,
+        'stdlib_ms': stdlib_ms,
+        'fast_ms': fast_ms,
+        'identity_bytes': len(body),
+        'gzip_bytes': len(gzip.compress(body, compresslevel=backend.config.GZIP_LEVEL)),
+        'gzip_ms': time_call(lambda: compress(body, 'gzip'), iterations),
+    }
+    if 'br' in available_encodings():
+        row['br_bytes'] = len(compress(body, 'br'))
+        row['br_ms'] = time_call(lambda: compress(body, 'br'), iterations)
+    return row
+
+
+def bench_cached_requests(iterations: int) -> dict:
+    """Average end-to-end time of /api/knowledge-base, cold vs precompressed"""
+    client = backend.app.test_client()
+    headers = {'Accept-Encoding': ', '.join(available_encodings())}
+
+    def cold():
+        response_layer.response_cache.clear()
+        client.get('/api/knowledge-base', headers=headers)
+
+    def warm():
+        client.get('/api/knowledge-base', headers=headers)
+
+    return {'cold_ms': time_call(cold, iterations), 'warm_ms': time_call(warm, iterations)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON serialization and compression per endpoint')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--sessions', type=int, default=200, help='synthetic sessions for /api/admin/chats')
+    args = parser.parse_args()
+
+    payloads = [('/api/knowledge-base', backend.build_knowledge_base_payload())]
+    for category in backend.knowledge_manager.get_all_categories():
+        payloads.append((f"/api/category/{category}", backend.knowledge_manager.get_category_info(category)))
+    payloads.append(('/api/admin/chats', build_fake_history(args.sessions)))
+
+    print(f"JSON encoder: {'orjson' if response_layer.orjson is not None else 'stdlib'}; "
+          f"encodings: {', '.join(available_encodings())}")
+    print(f"{'endpoint':<40} {'stdlib ms':>10} {'fast ms':>9} {'bytes':>9} {'gzip':>9} {'br':>9} {'saved':>7}")
+    for name, payload in payloads:
+        row = bench_payload(name, payload, args.iterations)
+        smallest = row.get('br_bytes', row['gzip_bytes'])
+        saved = 100 * (1 - smallest / row['identity_bytes']) if row['identity_bytes'] else 0
+        print(f"{name:<40} {row['stdlib_ms']:>10.3f} {row['fast_ms']:>9.3f} {row['identity_bytes']:>9} "
+              f"{row['gzip_bytes']:>9} {row.get('br_bytes', '-'):>9} {saved:>6.1f}%")
+
+    timings = bench_cached_requests(args.iterations)
+    print(f"\nGET /api/knowledge-base: {timings['cold_ms']:.3f} ms cold, {timings['warm_ms']:.3f} ms precompressed")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,21 +12,58 @@ class Config:
     
     # TinyLLaMA Configuration
     OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://localhost:11434')
+    # Comma-separated list of Ollama endpoints; defaults to OLLAMA_HOST alone
+    OLLAMA_HOSTS = [h.strip() for h in os.environ.get('OLLAMA_HOSTS', OLLAMA_HOST).split(',') if h.strip()]
+    OLLAMA_HOST_FAILURE_THRESHOLD = int(os.environ.get('OLLAMA_HOST_FAILURE_THRESHOLD', '2'))
+    OLLAMA_HOST_COOLDOWN = float(os.environ.get('OLLAMA_HOST_COOLDOWN', '10'))  # seconds
     MODEL_NAME = os.environ.get('MODEL_NAME', 'tinyllama')
     
+    # Async Ollama client pool (asgi.py serving mode), timeouts in seconds
+    OLLAMA_MAX_CONNECTIONS = int(os.environ.get('OLLAMA_MAX_CONNECTIONS', '32'))
+    OLLAMA_MAX_KEEPALIVE = int(os.environ.get('OLLAMA_MAX_KEEPALIVE', '16'))
+    OLLAMA_KEEPALIVE_EXPIRY = float(os.environ.get('OLLAMA_KEEPALIVE_EXPIRY', '30'))
+    OLLAMA_CONNECT_TIMEOUT = float(os.environ.get('OLLAMA_CONNECT_TIMEOUT', '5'))
+    OLLAMA_WRITE_TIMEOUT = float(os.environ.get('OLLAMA_WRITE_TIMEOUT', '10'))
+    OLLAMA_READ_TIMEOUT = float(os.environ.get('OLLAMA_READ_TIMEOUT', '30'))
+    # Waiting for a free pooled connection; queued chats are cheap so allow a long wait
+    OLLAMA_POOL_TIMEOUT = float(os.environ.get('OLLAMA_POOL_TIMEOUT', '120'))
+    
     # Knowledge Base Configuration
     KNOWLEDGE_BASE_PATH = os.path.join(os.path.dirname(__file__), 'knowledge_base')
     CACHE_PATH = os.path.join(os.path.dirname(__file__), 'cache')
     
+    # Admin settings and chat history shared across server workers (SQLite)
+    SHARED_STATE_PATH = os.environ.get('SHARED_STATE_PATH', os.path.join(CACHE_PATH, 'shared_state.db'))
+    # Oldest chat messages are dropped beyond this many (0 = keep all until restart)
+    CHAT_HISTORY_MAX_ROWS = int(os.environ.get('CHAT_HISTORY_MAX_ROWS', '10000'))
+    
+    # Production Server (serve.py)
+    SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:5000')
+    SERVER_WORKERS = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '8'))
+    
     # Embedding Configuration
     EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
     SIMILARITY_THRESHOLD = 0.7
     MAX_CONTEXT_LENGTH = 1000
+    MAX_SEARCH_RESULTS = 20  # upper bound for /api/search top_k
     
     # Response Configuration
     MAX_RESPONSE_LENGTH = 500
     CACHE_TTL = 3600  # 1 hour in seconds
     
+    # Response Serialization / Compression
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))  # bytes
+    GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+    BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+    RESPONSE_CACHE_SIZE = 64  # precompressed versioned payloads kept in memory
+    
+    # Query Log Capture (for replay_queries.py)
+    QUERY_LOG_ENABLED = os.environ.get('QUERY_LOG_ENABLED', 'False').lower() == 'true'
+    QUERY_LOG_PATH = os.environ.get('QUERY_LOG_PATH', os.path.join(CACHE_PATH, 'query_log.jsonl'))
+    # Salt for session id hashes; random per start unless set
+    QUERY_LOG_SALT = os.environ.get('QUERY_LOG_SALT') or os.urandom(8).hex()
+    
     @staticmethod
     def init_app(app):
         # Create necessary directories
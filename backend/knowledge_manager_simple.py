@@ -2,7 +2,7 @@
 
 import json
 import os
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Iterable
 from difflib import SequenceMatcher
 import re
 from config import Config
@@ -12,21 +12,85 @@ class KnowledgeBaseManager:
         self.config = Config()
         self.knowledge_base = {}
         self.fixed_qa = {}
+        # Search index partitioned by category: {category: [prepared item, ...]}
+        self.partitions = {}
+        # (size, mtime) of each category file when its partition was built
+        self.partition_signatures = {}
+        # Per-category version, bumped whenever that partition is rebuilt
+        self.category_versions = {}
+        # Normalized question -> answer for the fixed Q&A pairs
+        self.fixed_qa_index = {}
         self.load_knowledge_base()
-        self.load_fixed_qa()
+        if 'fixed_qa' not in self.knowledge_base:
+            # Otherwise loaded along with its partition
+            self.load_fixed_qa()
+    
+    def category_file(self, category: str) -> str:
+        return os.path.join(self.config.KNOWLEDGE_BASE_PATH, f"{category}.json")
     
     def load_knowledge_base(self):
-        """Load all knowledge base files"""
+        """Load all knowledge base files, rebuilding only partitions whose file changed"""
         kb_path = self.config.KNOWLEDGE_BASE_PATH
         
+        present = set()
         for filename in os.listdir(kb_path):
             if filename.endswith('.json'):
-                filepath = os.path.join(kb_path, filename)
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    category = filename.replace('.json', '')
-                    self.knowledge_base[category] = data
-                    print(f"Loaded knowledge base: {category}")
+                category = filename.replace('.json', '')
+                present.add(category)
+                self.reload_category(category)
+        
+        for category in list(self.knowledge_base):
+            if category not in present:
+                self.drop_category(category)
+    
+    def reload_category(self, category: str) -> bool:
+        """(Re)build one category partition if its file changed; returns True if rebuilt"""
+        filepath = self.category_file(category)
+        if not os.path.exists(filepath):
+            return self.drop_category(category)
+        
+        stat = os.stat(filepath)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if self.partition_signatures.get(category) == signature:
+            return False
+        
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.knowledge_base[category] = data
+        self.partitions[category] = self.build_partition(data)
+        self.partition_signatures[category] = signature
+        self.category_versions[category] = self.category_versions.get(category, 0) + 1
+        print(f"Loaded knowledge base: {category}")
+        
+        if category == 'fixed_qa':
+            self.load_fixed_qa()
+        return True
+    
+    def drop_category(self, category: str) -> bool:
+        """Forget a category whose file was removed"""
+        if category not in self.knowledge_base:
+            return False
+        for index in (self.knowledge_base, self.partitions, self.partition_signatures):
+            index.pop(category, None)
+        self.category_versions[category] = self.category_versions.get(category, 0) + 1
+        
+        if category == 'fixed_qa':
+            self.load_fixed_qa()
+        return True
+    
+    def build_partition(self, data) -> List[Dict]:
+        """Pre-normalize a category's items so searches don't redo it per query"""
+        partition = []
+        if isinstance(data, list):
+            for item in data:
+                if isinstance(item, dict):
+                    partition.append({
+                        'question': item.get('question', ''),
+                        'answer': item.get('answer', ''),
+                        'question_normalized': self.normalize_text(item.get('question', '')),
+                        'answer_normalized': self.normalize_text(item.get('answer', ''))
+                    })
+        return partition
     
     def load_fixed_qa(self):
         """Load fixed Q&A pairs for common questions"""
@@ -37,7 +101,13 @@ class KnowledgeBaseManager:
                 self.fixed_qa = json.load(f)
                 print(f"Loaded {len(self.fixed_qa)} fixed Q&A pairs")
         else:
+            self.fixed_qa = {}
             print("No fixed Q&A file found")
+        
+        # First pair wins on duplicate questions, as with a linear scan
+        self.fixed_qa_index = {}
+        for qa_pair in self.fixed_qa:
+            self.fixed_qa_index.setdefault(self.normalize_text(qa_pair['question']), qa_pair['answer'])
     
     def normalize_text(self, text: str) -> str:
         """Simple text normalization"""
@@ -49,61 +119,82 @@ class KnowledgeBaseManager:
     
     def find_exact_match(self, question: str) -> Optional[str]:
         """Find exact match in fixed Q&A"""
-        question_lower = self.normalize_text(question)
-        
-        for qa_pair in self.fixed_qa:
-            if self.normalize_text(qa_pair['question']) == question_lower:
-                return qa_pair['answer']
-        
-        return None
+        return self.fixed_qa_index.get(self.normalize_text(question))
+    
+    def select_partitions(self, categories: Optional[Iterable[str]] = None,
+                          exclude: Optional[Iterable[str]] = None) -> List[str]:
+        """Categories to search: all (or only `categories`), minus `exclude`"""
+        excluded = set(exclude or ())
+        if categories is None:
+            selected = self.partitions.keys()
+        else:
+            wanted = set(categories)
+            selected = [category for category in self.partitions if category in wanted]
+        return [category for category in selected if category not in excluded]
     
-    def find_similar_content(self, question: str, top_k: int = 3) -> List[Dict]:
-        """Find similar content using simple text matching"""
+    def find_similar_content(self, question: str, top_k: int = 3,
+                             categories: Optional[Iterable[str]] = None,
+                             exclude: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Find similar content using simple text matching.
+        
+        Only the partitions chosen by `categories`/`exclude` are scored.
+        """
         question_normalized = self.normalize_text(question)
         question_words = question_normalized.split()
         
         results = []
         
-        # Search through all knowledge base content
-        for category, data in self.knowledge_base.items():
-            if isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict):
-                        question_text = self.normalize_text(item.get('question', ''))
-                        answer_text = self.normalize_text(item.get('answer', ''))
-                        
-                        # Calculate similarity
-                        similarity = self.calculate_similarity(question_normalized, question_text)
-                        
-                        # Also check for keyword matches
-                        keyword_matches = sum(1 for word in question_words if word in question_text or word in answer_text)
-                        keyword_score = keyword_matches / len(question_words) if question_words else 0
-                        
-                        # Combined score
-                        combined_score = (similarity + keyword_score) / 2
-                        
-                        if combined_score >= self.config.SIMILARITY_THRESHOLD:
-                            results.append({
-                                'similarity': combined_score,
-                                'category': category,
-                                'question': item.get('question', ''),
-                                'answer': item.get('answer', ''),
-                                'context': f"{item.get('question', '')} {item.get('answer', '')}"
-                            })
+        for category in self.select_partitions(categories, exclude):
+            for item in self.partitions[category]:
+                question_text = item['question_normalized']
+                answer_text = item['answer_normalized']
+                
+                # Calculate similarity
+                similarity = self.calculate_similarity(question_normalized, question_text)
+                
+                # Also check for keyword matches
+                keyword_matches = sum(1 for word in question_words if word in question_text or word in answer_text)
+                keyword_score = keyword_matches / len(question_words) if question_words else 0
+                
+                # Combined score
+                combined_score = (similarity + keyword_score) / 2
+                
+                if combined_score >= self.config.SIMILARITY_THRESHOLD:
+                    results.append({
+                        'similarity': combined_score,
+                        'category': category,
+                        'question': item['question'],
+                        'answer': item['answer'],
+                        'context': f"{item['question']} {item['answer']}"
+                    })
         
         # Sort by similarity and return top results
         results.sort(key=lambda x: x['similarity'], reverse=True)
         return results[:top_k]
     
-    def get_context_for_question(self, question: str) -> Tuple[str, str, str]:
+    def get_context_for_question(self, question: str,
+                                 categories: Optional[Iterable[str]] = None,
+                                 disabled: Optional[Iterable[str]] = None) -> Tuple[str, str, str]:
         """Get context and answer for a question"""
+        context, match_type, category, _ = self.search_for_question(question, categories, disabled)
+        return context, match_type, category
+    
+    def search_for_question(self, question: str,
+                            categories: Optional[Iterable[str]] = None,
+                            disabled: Optional[Iterable[str]] = None) -> Tuple[str, str, str, List[Dict]]:
+        """Like get_context_for_question, but also returns the scored items.
+        
+        Disabled categories are skipped before scoring; they are only searched
+        when nothing enabled matches, to report a 'disabled_category' hit.
+        """
         # First try exact match
         exact_answer = self.find_exact_match(question)
         if exact_answer:
-            return exact_answer, "exact_match", "general"
+            return exact_answer, "exact_match", "general", []
         
         # Then try similarity search
-        similar_items = self.find_similar_content(question)
+        disabled = set(disabled or ())
+        similar_items = self.find_similar_content(question, categories=categories, exclude=disabled)
         if similar_items:
             # Combine top results as context
             context_parts = []
@@ -111,9 +202,15 @@ class KnowledgeBaseManager:
                 context_parts.append(f"Q: {item['question']}\nA: {item['answer']}")
             
             context = "\n\n".join(context_parts)
-            return context, "similarity_search", similar_items[0]['category']
+            return context, "similarity_search", similar_items[0]['category'], similar_items
+        
+        if disabled:
+            scoped = disabled if categories is None else disabled.intersection(categories)
+            disabled_items = self.find_similar_content(question, top_k=1, categories=scoped)
+            if disabled_items:
+                return "", "disabled_category", disabled_items[0]['category'], disabled_items
         
-        return "", "no_match", "general"
+        return "", "no_match", "general", []
     
     def get_all_categories(self) -> List[str]:
         """Get all available knowledge base categories"""
@@ -1,32 +1,207 @@
 # TinyLLaMA Integration
 
+import asyncio
 import requests
 import json
 import time
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple
 from config import Config
 
+# Only needed for the async serving mode (asgi.py)
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Failures of the host itself: counted against it, and the next host is tried
+TRANSPORT_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+# Our own faults (client pool exhausted, request cancelled): say nothing about the host
+LOCAL_ERRORS = (asyncio.CancelledError, GeneratorExit) + ((httpx.PoolTimeout,) if httpx else ())
+
+class OllamaHost:
+    """Health, load and latency bookkeeping for one Ollama endpoint"""
+    
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.avg_latency = None  # exponentially weighted, seconds
+        self.last_error = None
+    
+    def is_available(self, now: float) -> bool:
+        """Healthy, or unhealthy but past its cooldown (worth one more try)"""
+        return now >= self.unhealthy_until
+    
+    def is_unhealthy(self) -> bool:
+        return self.consecutive_failures >= Config.OLLAMA_HOST_FAILURE_THRESHOLD
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host": self.url,
+            "healthy": not self.is_unhealthy(),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "avg_latency_ms": round(self.avg_latency * 1000, 1) if self.avg_latency is not None else None,
+            "last_error": self.last_error
+        }
+
+
+class OllamaHostPool:
+    """Routes each generation to the available host with the fewest outstanding requests"""
+    
+    LATENCY_ALPHA = 0.2
+    
+    def __init__(self, urls: Iterable[str]):
+        self.hosts = [OllamaHost(url) for url in urls]
+        if not self.hosts:
+            raise ValueError("at least one Ollama host is required")
+        self.lock = threading.Lock()
+    
+    def acquire(self, exclude: Iterable[OllamaHost] = ()) -> Optional[OllamaHost]:
+        """Reserve the least loaded host not in exclude, or None if none is usable.
+
+        Hosts in their failure cooldown are skipped. Once the cooldown is over an
+        unhealthy host gets a single probe request; it stays out of rotation for
+        another cooldown unless that request succeeds.
+        """
+        now = time.monotonic()
+        with self.lock:
+            available = [h for h in self.hosts if h not in exclude and h.is_available(now)]
+            if not available:
+                return None
+            host = min(available, key=lambda h: (h.outstanding, h.avg_latency or 0.0))
+            if host.is_unhealthy():
+                host.unhealthy_until = now + Config.OLLAMA_HOST_COOLDOWN
+            host.outstanding += 1
+            host.requests += 1
+            return host
+    
+    def release(self, host: OllamaHost, latency: Optional[float] = None, error: Optional[str] = None):
+        """Return a reserved host, recording the outcome of the request"""
+        with self.lock:
+            host.outstanding -= 1
+            if error is None:
+                self._mark_success(host, latency)
+            else:
+                self._mark_failure(host, error)
+    
+    def abandon(self, host: OllamaHost):
+        """Return a reserved host without recording an outcome"""
+        with self.lock:
+            host.outstanding -= 1
+    
+    def mark(self, host: OllamaHost, ok: bool, error: Optional[str] = None):
+        """Record the outcome of a health probe"""
+        with self.lock:
+            if ok:
+                self._mark_success(host, None)
+            else:
+                self._mark_failure(host, error)
+    
+    def _mark_success(self, host: OllamaHost, latency: Optional[float]):
+        host.consecutive_failures = 0
+        host.unhealthy_until = 0.0
+        if latency is not None:
+            if host.avg_latency is None:
+                host.avg_latency = latency
+            else:
+                host.avg_latency += self.LATENCY_ALPHA * (latency - host.avg_latency)
+    
+    def _mark_failure(self, host: OllamaHost, error: str):
+        host.failures += 1
+        host.consecutive_failures += 1
+        host.last_error = error
+        if host.is_unhealthy():
+            host.unhealthy_until = time.monotonic() + Config.OLLAMA_HOST_COOLDOWN
+    
+    def stats(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [host.stats() for host in self.hosts]
+
+
+class HostAttempt:
+    """One generation request on a reserved host.
+
+    Wrap the transport call in `with attempt:`; on exit the host is released
+    and the outcome recorded. Bad replies and transport errors count against
+    the host and the next one is tried. Our own faults release it without a
+    verdict and end the failover.
+    """
+    
+    def __init__(self, pool: OllamaHostPool, host: OllamaHost):
+        self.pool = pool
+        self.host = host
+        self.url = f"{host.url}/api/generate"
+        self.answer = None
+        self.error = "no reply"
+        self.latency = None
+        self.give_up = False
+    
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+    
+    def complete(self, answer: Optional[str], error: Optional[str]):
+        """Record a parsed reply (see TinyLLaMAIntegration.parse_generation)"""
+        self.answer, self.error = answer, error
+        if error is None:
+            self.latency = time.monotonic() - self.start
+        else:
+            print(f"Error generating response on {self.host.url}: {error}")
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc is None:
+            self.pool.release(self.host, latency=self.latency, error=self.error)
+            return False
+        if isinstance(exc, TRANSPORT_ERRORS) and not isinstance(exc, LOCAL_ERRORS):
+            self.error = repr(exc)
+            print(f"Request error on {self.host.url}: {self.error}")
+            self.pool.release(self.host, error=self.error)
+            return True
+        # Not the host's fault; another host wouldn't do better
+        self.pool.abandon(self.host)
+        self.give_up = True
+        if httpx is not None and isinstance(exc, httpx.PoolTimeout):
+            print(f"No free connection to {self.host.url} within OLLAMA_POOL_TIMEOUT")
+            return True
+        return False
+
+
 class TinyLLaMAIntegration:
-    def __init__(self):
+    def __init__(self, pool: Optional[OllamaHostPool] = None):
         self.config = Config()
-        self.base_url = self.config.OLLAMA_HOST
+        # Pass the pool in to share host load/health with another client in this process
+        self.pool = pool or OllamaHostPool(self.config.OLLAMA_HOSTS)
+        self.base_url = self.pool.hosts[0].url
         self.model_name = self.config.MODEL_NAME
         self.session = requests.Session()
     
-    def check_ollama_status(self) -> bool:
-        """Check if Ollama server is running"""
+    def check_host_status(self, host: OllamaHost) -> bool:
+        """Probe one Ollama host and update its health state"""
         try:
-            response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
-            return response.status_code == 200
-        except requests.exceptions.RequestException:
+            response = self.session.get(f"{host.url}/api/tags", timeout=5)
+            ok = response.status_code == 200
+            self.pool.mark(host, ok, None if ok else f"HTTP {response.status_code}")
+            return ok
+        except requests.exceptions.RequestException as e:
+            self.pool.mark(host, False, str(e))
             return False
     
-    def generate_response(self, question: str, context: str = "") -> Optional[str]:
-        """Generate response using TinyLLaMA"""
-        if not self.check_ollama_status():
-            print("Ollama server is not running")
-            return None
-        
+    def live_hosts(self) -> List[OllamaHost]:
+        """Probe every host and return the ones that answered"""
+        return [host for host in self.pool.hosts if self.check_host_status(host)]
+    
+    def check_ollama_status(self) -> bool:
+        """Check if at least one Ollama server is running"""
+        return bool(self.live_hosts())
+    
+    def build_payload(self, question: str, context: str = "") -> Dict[str, Any]:
+        """Build the Ollama /api/generate request body"""
         # Prepare the prompt
         if context:
             prompt = f"""You are a helpful HR assistant for new employees. Answer the question based on the provided context.
@@ -44,7 +219,6 @@ Question: {question}
 
 Answer:"""
         
-        # Prepare the request payload
         payload = {
             "model": self.model_name,
             "prompt": prompt,
@@ -55,25 +229,50 @@ Answer:"""
                 "max_tokens": self.config.MAX_RESPONSE_LENGTH
             }
         }
-        
+        return payload
+    
+    def parse_generation(self, response) -> Tuple[Optional[str], Optional[str]]:
+        """(answer, None) from an /api/generate response, or (None, error) if the host failed"""
+        if response.status_code != 200:
+            return None, f"HTTP {response.status_code}"
         try:
-            response = self.session.post(
-                f"{self.base_url}/api/generate",
-                json=payload,
-                headers={"Content-Type": "application/json"},
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
-            else:
-                print(f"Error generating response: {response.status_code}")
-                return None
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Request error: {e}")
-            return None
+            result = response.json()
+        except ValueError as e:
+            return None, f"invalid JSON: {e}"
+        answer = result.get('response') if isinstance(result, dict) else None
+        if not isinstance(answer, str):
+            return None, "no 'response' field in reply"
+        return answer.strip(), None
+    
+    def attempts(self) -> Iterator[HostAttempt]:
+        """Failover order for one generation: a fresh host per attempt until one answers"""
+        tried = []
+        while True:
+            host = self.pool.acquire(exclude=tried)
+            if host is None:
+                print("No Ollama server could generate a response")
+                return
+            tried.append(host)
+            attempt = HostAttempt(self.pool, host)
+            yield attempt
+            if attempt.error is None or attempt.give_up:
+                return
+    
+    def generate_response(self, question: str, context: str = "") -> Optional[str]:
+        """Generate response using TinyLLaMA, failing over across hosts"""
+        payload = self.build_payload(question, context)
+        for attempt in self.attempts():
+            with attempt:
+                response = self.session.post(
+                    attempt.url,
+                    json=payload,
+                    headers={"Content-Type": "application/json"},
+                    timeout=(self.config.OLLAMA_CONNECT_TIMEOUT, self.config.OLLAMA_READ_TIMEOUT)
+                )
+                attempt.complete(*self.parse_generation(response))
+            if attempt.error is None:
+                return attempt.answer
+        return None
     
     def generate_embedding(self, text: str) -> Optional[list]:
         """Generate embedding using TinyLLaMA (if supported)"""
@@ -86,17 +285,20 @@ Answer:"""
         result = {
             "ollama_running": False,
             "model_available": False,
-            "test_response": None
+            "test_response": None,
+            "hosts": []
         }
         
-        if not self.check_ollama_status():
+        live_hosts = self.live_hosts()
+        result["hosts"] = self.pool.stats()
+        if not live_hosts:
             return result
         
         result["ollama_running"] = True
         
         # Check if model is available
         try:
-            response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self.session.get(f"{live_hosts[0].url}/api/tags", timeout=5)
             if response.status_code == 200:
                 models = response.json().get('models', [])
                 model_names = [model.get('name', '') for model in models]
@@ -111,3 +313,44 @@ Answer:"""
             result["test_response"] = test_response
         
         return result
+
+
+class AsyncTinyLLaMAIntegration(TinyLLaMAIntegration):
+    """Non-blocking TinyLLaMA client backed by a pooled keep-alive httpx.AsyncClient.
+
+    Used by the async serving mode: a chat waiting on Ollama is a suspended
+    coroutine rather than a blocked thread.
+    """
+    
+    def __init__(self, pool: Optional[OllamaHostPool] = None):
+        super().__init__(pool)
+        if httpx is None:
+            raise RuntimeError("httpx is required for the async serving mode (pip install httpx)")
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.config.OLLAMA_MAX_CONNECTIONS,  # across all hosts
+                max_keepalive_connections=self.config.OLLAMA_MAX_KEEPALIVE,
+                keepalive_expiry=self.config.OLLAMA_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                connect=self.config.OLLAMA_CONNECT_TIMEOUT,
+                read=self.config.OLLAMA_READ_TIMEOUT,
+                write=self.config.OLLAMA_WRITE_TIMEOUT,
+                pool=self.config.OLLAMA_POOL_TIMEOUT
+            )
+        )
+    
+    async def generate_response_async(self, question: str, context: str = "") -> Optional[str]:
+        """Generate response using TinyLLaMA without blocking the event loop"""
+        payload = self.build_payload(question, context)
+        for attempt in self.attempts():
+            with attempt:
+                response = await self.client.post(attempt.url, json=payload)
+                attempt.complete(*self.parse_generation(response))
+            if attempt.error is None:
+                return attempt.answer
+        return None
+    
+    async def aclose(self):
+        """Close pooled connections"""
+        await self.client.aclose()
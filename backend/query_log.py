@@ -0,0 +1,107 @@
+# Query Log - anonymized capture of production chat queries for replay
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+from config import Config
+
+# Session ids used by replay_queries.py; never captured or kept in chat history
+REPLAY_SESSION_PREFIX = 'replay-'
+
+# Scrubbed from questions before they are written
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+NUMBER_PATTERN = re.compile(r'\+?\d[\d\s().-]{5,}\d')
+
+
+def is_replay_session(session_id) -> bool:
+    return isinstance(session_id, str) and session_id.startswith(REPLAY_SESSION_PREFIX)
+
+
+def anonymize_question(question: str) -> str:
+    """Mask e-mail addresses and long digit runs (phone/employee numbers)"""
+    question = EMAIL_PATTERN.sub('<email>', question)
+    return NUMBER_PATTERN.sub('<number>', question)
+
+
+def short_hash(text: str, salt: str = '') -> str:
+    return hashlib.sha256(f"{salt}{text}".encode('utf-8')).hexdigest()[:12]
+
+
+class QueryLogger:
+    """Append-only JSON-lines log of chat queries, retrieval results and timings.
+
+    One compact line per query:
+      t   unix time            s   salted session hash    q  anonymized question
+      sc  category/department filter sent with the chat
+      d   disabled categories  m   match_type
+      c   category             h   [[category, score], ...] top retrieval hits
+      a   answer hash          rt/lt/tt  KB search/LLM/total milliseconds
+    """
+
+    def __init__(self, path: str, enabled: bool = False, salt: str = ''):
+        self.path = path
+        self.enabled = enabled
+        self.salt = salt
+        self.lock = threading.Lock()
+        self.file = None
+
+    def record(self, session_id: str, question: str, scope: Dict[str, str], disabled,
+               hits: List[Dict], response: Dict[str, Any],
+               retrieval_ms: float, llm_ms: float, total_ms: float):
+        """Append one chat turn; no-op unless logging is enabled"""
+        if not self.enabled:
+            return
+
+        entry = {
+            't': round(time.time(), 3),
+            's': short_hash(session_id, self.salt),
+            'q': anonymize_question(question),
+            'm': response['match_type'],
+            'c': response['category'],
+            'h': [[hit['category'], round(hit['similarity'], 4)] for hit in hits],
+            'a': short_hash(response['answer']),
+            'rt': round(retrieval_ms, 2),
+            'lt': round(llm_ms, 2),
+            'tt': round(total_ms, 2)
+        }
+        if scope:
+            entry['sc'] = scope
+        if disabled:
+            entry['d'] = sorted(disabled)
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+        try:
+            with self.lock:
+                if self.file is None:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    self.file = open(self.path, 'a', encoding='utf-8', buffering=1)
+                self.file.write(line)
+        except OSError as e:
+            print(f"Error writing query log: {e}")
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_query_log(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield entries from a captured log, skipping truncated lines"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+query_logger = QueryLogger(Config.QUERY_LOG_PATH, enabled=Config.QUERY_LOG_ENABLED, salt=Config.QUERY_LOG_SALT)
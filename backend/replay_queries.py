@@ -0,0 +1,314 @@
+# Query Log Replay
+#
+# Usage: python replay_queries.py LOG [--target kb|api] [--url URL] [--speed X]
+#                                     [--concurrency N] [--limit N] [--json]
+#
+# Replays a log captured with QUERY_LOG_ENABLED=true against the current code
+# and reports latency percentiles, the fast-path vs LLM ratio and every
+# match type / category / answer that differs from the recorded run.
+#
+#   --target kb   time KnowledgeBaseManager.search_for_question (recorded
+#                 disabled categories are applied)
+#   --target api  POST /api/chat, in-process unless --url points at a server.
+#                 Queries recorded under different disabled categories than the
+#                 server has now are reported separately, not as regressions
+#                 (reading a remote server's settings uses ADMIN_USERNAME /
+#                 ADMIN_PASSWORD). Replayed sessions are never captured or
+#                 kept in chat history; in-process replays run on a private
+#                 copy of the shared store's settings.
+#   --speed       1 replays at the recorded pace, 10 ten times faster,
+#                 0 as fast as possible
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from config import Config
+from query_log import read_query_log, short_hash, query_logger, REPLAY_SESSION_PREFIX
+
+# The app module; imported by load_backend once the shared store is chosen
+backend = None
+
+LLM_MATCH_TYPE = 'similarity_search'
+
+
+def load_backend(shared_state_path: Optional[str] = None):
+    """Import the app, optionally on another shared store than the live one"""
+    global backend
+    if shared_state_path:
+        os.environ['SHARED_STATE_PATH'] = Config.SHARED_STATE_PATH = shared_state_path
+    import app
+    backend = app
+
+
+def copy_shared_state(directory: str) -> str:
+    """Copy the live shared store's settings into directory, without chat history"""
+    path = os.path.join(directory, 'shared_state.db')
+    if os.path.exists(Config.SHARED_STATE_PATH):
+        live, copy = sqlite3.connect(Config.SHARED_STATE_PATH), sqlite3.connect(path)
+        try:
+            live.backup(copy)
+            copy.execute('DROP TABLE IF EXISTS chat_history')
+            copy.commit()
+        finally:
+            live.close()
+            copy.close()
+    return path
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None
+    }
+
+
+def llm_ratio(match_types: List[str]) -> Optional[float]:
+    """Share of queries that needed the LLM (the rest took the fast path)"""
+    if not match_types:
+        return None
+    return sum(1 for m in match_types if m == LLM_MATCH_TYPE) / len(match_types)
+
+
+class KnowledgeBaseTarget:
+    """Replays retrieval only, against the current knowledge base"""
+
+    recorded_latency_key = 'rt'
+
+    def current_disabled(self):
+        """None: the recorded disabled categories are applied to every query"""
+        return None
+
+    def run(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        scope = entry.get('sc') or {}
+        categories = backend.resolve_search_scope(**scope)
+        start = time.perf_counter()
+        context, match_type, category, _ = backend.knowledge_manager.search_for_question(
+            entry['q'], categories=categories, disabled=entry.get('d')
+        )
+        latency = (time.perf_counter() - start) * 1000
+        # Only exact matches produce their answer without the app layer
+        answer = short_hash(context) if match_type == 'exact_match' else None
+        return {'latency_ms': latency, 'match_type': match_type, 'category': category, 'answer': answer}
+
+
+class ApiTarget:
+    """Replays full /api/chat requests, in-process or against a running server"""
+
+    recorded_latency_key = 'tt'
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url.rstrip('/') if url else None
+        self.local = threading.local()
+
+    def current_disabled(self) -> Optional[set]:
+        """Categories the target currently has disabled, or None if they can't be read"""
+        if not self.url:
+            backend.sync_shared_state()
+            return backend.get_disabled_categories()
+        try:
+            login = requests.post(f"{self.url}/api/admin/login", timeout=10, json={
+                'username': backend.ADMIN_USERNAME,
+                'password': backend.ADMIN_PASSWORD
+            })
+            token = login.json()['token']
+            settings = requests.get(f"{self.url}/api/admin/kb/categories/settings", timeout=10,
+                                    headers={'Authorization': f"Bearer {token}"}).json()
+            return {cat for cat, cs in settings.items() if cs.get('enabled') is False}
+        except (requests.exceptions.RequestException, ValueError, KeyError, AttributeError) as e:
+            print(f"Could not read category settings from {self.url}: {e}")
+            return None
+
+    def post(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        if self.url:
+            if not hasattr(self.local, 'session'):
+                self.local.session = requests.Session()
+            return self.local.session.post(f"{self.url}/api/chat", json=body, timeout=120).json()
+        if not hasattr(self.local, 'client'):
+            self.local.client = backend.app.test_client()
+        return self.local.client.post('/api/chat', json=body).get_json()
+
+    def run(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        body = {'question': entry['q'], 'session_id': f"{REPLAY_SESSION_PREFIX}{entry.get('s', '')}"}
+        body.update(entry.get('sc') or {})
+        start = time.perf_counter()
+        result = self.post(body)
+        latency = (time.perf_counter() - start) * 1000
+        return {
+            'latency_ms': latency,
+            'match_type': result.get('match_type'),
+            'category': result.get('category'),
+            'answer': short_hash(result['answer']) if 'answer' in result else None
+        }
+
+
+def replay(entries: List[Dict[str, Any]], target, speed: float, concurrency: int) -> List[Dict[str, Any]]:
+    """Run every entry, pacing by recorded timestamps divided by speed"""
+    results: List[Optional[Dict[str, Any]]] = [None] * len(entries)
+
+    def run_one(index: int):
+        try:
+            results[index] = target.run(entries[index])
+        except Exception as e:
+            results[index] = {'error': str(e)}
+
+    first = entries[0].get('t', 0) if entries else 0
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, entry in enumerate(entries):
+            if speed > 0:
+                due = (entry.get('t', first) - first) / speed
+                delay = due - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(run_one, index)
+    return results
+
+
+def compare(entries: List[Dict[str, Any]], results: List[Dict[str, Any]], latency_key: str,
+            current_disabled: Optional[set] = None, settings_known: bool = True) -> Dict[str, Any]:
+    """Diff replayed results against the recording.
+
+    With current_disabled set, differences on queries recorded under other
+    disabled categories go to 'settings_changed' instead of 'changes'.
+    """
+    changes = {'match_type': [], 'category': [], 'answer': []}
+    settings_changed = {'queries': 0, 'differences': []}
+    errors = []
+    for entry, result in zip(entries, results):
+        if 'error' in result:
+            errors.append({'question': entry['q'], 'error': result['error']})
+            continue
+        differences = []
+        for field, key in (('match_type', 'm'), ('category', 'c')):
+            if result[field] != entry.get(key):
+                differences.append((field, {'question': entry['q'], 'recorded': entry.get(key), 'replayed': result[field]}))
+        # LLM answers are not deterministic; compare fast-path answers only
+        both_fast = entry.get('m') != LLM_MATCH_TYPE and result['match_type'] != LLM_MATCH_TYPE
+        if both_fast and result['answer'] is not None and result['answer'] != entry.get('a'):
+            differences.append(('answer', {'question': entry['q'], 'match_type': result['match_type']}))
+
+        if current_disabled is not None and set(entry.get('d', ())) != current_disabled:
+            settings_changed['queries'] += 1
+            settings_changed['differences'].extend(dict(change, field=field) for field, change in differences)
+            continue
+        for field, change in differences:
+            changes[field].append(change)
+
+    ok = [r for r in results if 'error' not in r]
+    return {
+        'queries': len(entries),
+        'errors': errors,
+        'recorded_latency_ms': latency_summary([e[latency_key] for e in entries if latency_key in e]),
+        'replayed_latency_ms': latency_summary([r['latency_ms'] for r in ok]),
+        'recorded_llm_ratio': llm_ratio([e.get('m') for e in entries]),
+        'replayed_llm_ratio': llm_ratio([r['match_type'] for r in ok]),
+        'settings_known': settings_known,
+        'changes': changes,
+        'settings_changed': settings_changed
+    }
+
+
+def format_ms(value: Optional[float]) -> str:
+    return f"{value:.2f}" if value is not None else '-'
+
+
+def format_ratio(value: Optional[float]) -> str:
+    return f"{value * 100:.1f}% LLM / {(1 - value) * 100:.1f}% fast path" if value is not None else '-'
+
+
+def print_report(report: Dict[str, Any], examples: int = 10):
+    print(f"Replayed {report['queries']} queries ({len(report['errors'])} errors)")
+    print(f"{'latency ms':<12} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for label, key in (('recorded', 'recorded_latency_ms'), ('replayed', 'replayed_latency_ms')):
+        row = report[key]
+        print(f"{label:<12} {format_ms(row['p50']):>9} {format_ms(row['p90']):>9} "
+              f"{format_ms(row['p99']):>9} {format_ms(row['max']):>9}")
+    print(f"recorded: {format_ratio(report['recorded_llm_ratio'])}")
+    print(f"replayed: {format_ratio(report['replayed_llm_ratio'])}")
+    if not report['settings_known']:
+        print("warning: server category settings unknown; changes may come from settings, not code")
+    for field, changed in report['changes'].items():
+        print(f"\n{field} changes: {len(changed)}")
+        for change in changed[:examples]:
+            print(f"  {json.dumps(change, ensure_ascii=False)}")
+    settings_changed = report['settings_changed']
+    print(f"\nrecorded under other disabled categories: {settings_changed['queries']} queries, "
+          f"{len(settings_changed['differences'])} differences (not counted above)")
+    for change in settings_changed['differences'][:examples]:
+        print(f"  {json.dumps(change, ensure_ascii=False)}")
+    for error in report['errors'][:examples]:
+        print(f"error: {json.dumps(error, ensure_ascii=False)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a captured query log and report regressions')
+    parser.add_argument('log', help='query log captured with QUERY_LOG_ENABLED=true')
+    parser.add_argument('--target', choices=['kb', 'api'], default='kb')
+    parser.add_argument('--url', help='base URL of a running backend (api target); in-process if omitted')
+    parser.add_argument('--speed', type=float, default=0, help='1 = recorded pace, 0 = as fast as possible')
+    parser.add_argument('--concurrency', type=int, help='parallel replays (default: 1 for kb, 8 for api)')
+    parser.add_argument('--limit', type=int, help='replay only the first N queries')
+    parser.add_argument('--json', action='store_true', help='print the full report as JSON')
+    args = parser.parse_args()
+
+    entries = list(read_query_log(args.log))
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        print("No queries in log")
+        return
+
+    # Don't capture the replay itself
+    query_logger.enabled = False
+
+    # In-process API replays write through the app; keep them off the live store
+    private_dir = tempfile.mkdtemp(prefix='replay-') if args.target == 'api' and not args.url else None
+    try:
+        load_backend(copy_shared_state(private_dir) if private_dir else None)
+        report = run_replay(entries, args)
+    finally:
+        if private_dir:
+            shutil.rmtree(private_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+def run_replay(entries: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    if args.target == 'kb':
+        # Retrieval is CPU-bound; replaying it in parallel only measures GIL contention
+        target, concurrency = KnowledgeBaseTarget(), args.concurrency or 1
+    else:
+        target, concurrency = ApiTarget(args.url), args.concurrency or 8
+    current_disabled = target.current_disabled()
+    settings_known = args.target == 'kb' or current_disabled is not None
+    results = replay(entries, target, args.speed, concurrency)
+    return compare(entries, results, target.recorded_latency_key, current_disabled, settings_known)
+
+
+if __name__ == '__main__':
+    main()
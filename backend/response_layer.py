@@ -0,0 +1,189 @@
+# Response Layer - fast JSON serialization and negotiated compression
+
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+from config import Config
+
+# Optional accelerators; the stdlib is used when they are not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/')
+
+
+def dumps_bytes(obj: Any, indent: bool = False, default: Optional[Callable] = None) -> bytes:
+    """Serialize obj to UTF-8 JSON bytes, preferring orjson when available"""
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except (TypeError, orjson.JSONEncodeError):
+            # e.g. integers wider than 64 bits; let the stdlib handle it
+            pass
+
+    if indent:
+        text = json.dumps(obj, default=default, sort_keys=True, ensure_ascii=False, indent=2)
+    else:
+        text = json.dumps(obj, default=default, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return text.encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that builds jsonify() bodies with dumps_bytes"""
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = dumps_bytes(obj, indent=indent, default=self.default) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def available_encodings() -> list:
+    """Content encodings we can produce, in order of preference"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    """Pick the best encoding the client accepts, or None for identity"""
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, max_effort: bool = False) -> bytes:
+    """Compress body; max_effort trades CPU for size on bodies compressed once"""
+    if encoding == 'br':
+        quality = 11 if max_effort else Config.BROTLI_QUALITY
+        return brotli.compress(body, quality=quality)
+    if encoding == 'gzip':
+        level = 9 if max_effort else Config.GZIP_LEVEL
+        return gzip.compress(body, compresslevel=level)
+    return body
+
+
+def _is_compressible(response) -> bool:
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    return (response.mimetype or '').startswith(COMPRESSIBLE_MIMETYPES)
+
+
+def compress_response(response):
+    """after_request hook: compress large bodies per the Accept-Encoding header"""
+    if not _is_compressible(response):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < Config.COMPRESSION_MIN_SIZE:
+        return response
+
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+class _CachedBody:
+    """Serialized payload plus its lazily built compressed variants"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.encoded: Dict[str, bytes] = {}
+        self.lock = threading.Lock()
+
+    def get(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        with self.lock:
+            if encoding not in self.encoded:
+                self.encoded[encoding] = compress(self.body, encoding, max_effort=True)
+            return self.encoded[encoding]
+
+
+class ResponseCache:
+    """Small LRU of serialized and precompressed bodies for versioned payloads"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[_CachedBody]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, version: Hashable, body: bytes) -> _CachedBody:
+        cached = _CachedBody(body)
+        with self.lock:
+            self.entries[key] = (version, cached)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return cached
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+response_cache = ResponseCache(Config.RESPONSE_CACHE_SIZE)
+
+
+def cached_json_response(key: Hashable, version: Hashable, build: Callable[[], Any]):
+    """JSON response for a payload that only changes when version changes.
+
+    build() is called on a cache miss; the serialized body and each compressed
+    variant are kept until the version moves on.
+    """
+    cached = response_cache.get(key, version)
+    if cached is None:
+        provider = current_app.json
+        indent = (provider.compact is None and current_app.debug) or provider.compact is False
+        body = dumps_bytes(build(), indent=indent, default=provider.default) + b"\n"
+        cached = response_cache.put(key, version, body)
+
+    encoding = None
+    if len(cached.body) >= Config.COMPRESSION_MIN_SIZE:
+        encoding = negotiate_encoding(request.accept_encodings)
+
+    response = current_app.response_class(cached.get(encoding), mimetype='application/json')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Install the fast JSON provider and response compression on app"""
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
@@ -0,0 +1,71 @@
+# Production Server
+#
+# Usage: python serve.py [--workers N] [--threads N] [--bind HOST:PORT] [--async]
+#
+# Loads the app and knowledge base once, then preforks worker processes with
+# gunicorn so they share those pages copy-on-write. Admin settings and
+# knowledge base edits reach every worker through shared_state.py.
+# --async serves asgi:application with uvicorn workers instead.
+# Requires a POSIX system (gunicorn does not run on Windows).
+
+import argparse
+import gc
+
+from gunicorn.app.base import BaseApplication
+
+from config import Config
+
+
+class PreforkServer(BaseApplication):
+    """gunicorn server for an application object that is already loaded"""
+
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the backend with preforked workers')
+    parser.add_argument('--bind', default=Config.SERVER_BIND)
+    parser.add_argument('--workers', type=int, default=Config.SERVER_WORKERS)
+    parser.add_argument('--threads', type=int, default=Config.SERVER_THREADS, help='threads per worker (sync mode)')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='serve asgi:application with uvicorn workers')
+    args = parser.parse_args()
+
+    import app
+    if args.use_async:
+        import asgi
+        application, worker_class = asgi.application, 'uvicorn.workers.UvicornWorker'
+    else:
+        application, worker_class = app.app, 'gthread'
+
+    # Chat history is on disk only so workers can share it; start empty
+    app.conversation_history.clear()
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': worker_class,
+        'preload_app': True,
+        # LLM calls can take a while on CPU-only hosts
+        'timeout': 120
+    }
+
+    # Everything loaded so far is shared with the workers copy-on-write; keep
+    # the garbage collector from touching (and so copying) those pages
+    gc.freeze()
+    print(f"Starting {args.workers} workers on {args.bind} ({worker_class})")
+    PreforkServer(application, options).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# Shared State - admin settings and chat history shared by every server worker process
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Tuple
+
+
+class SharedState:
+    """Versioned key/value store in a local SQLite file.
+
+    Every write bumps a single version number, so a worker can tell whether
+    anything changed with one tiny read and only reload when it did.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        """Per-thread, per-process connection (never reused across a fork)"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO meta (id, version) VALUES (0, 0)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS chat_history ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, item TEXT NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS chat_history_session ON chat_history (session_id, id)')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def version(self) -> int:
+        """Current version; changes whenever any worker writes"""
+        return self.connect().execute('SELECT version FROM meta WHERE id = 0').fetchone()[0]
+
+    def load(self) -> Tuple[int, Dict[str, Any]]:
+        """Consistent snapshot of (version, {key: value})"""
+        conn = self.connect()
+        conn.execute('BEGIN')
+        try:
+            version = conn.execute('SELECT version FROM meta WHERE id = 0').fetchone()[0]
+            values = {key: json.loads(value) for key, value in conn.execute('SELECT key, value FROM state')}
+        finally:
+            conn.execute('COMMIT')
+        return version, values
+
+    def update(self, values: Dict[str, Any]) -> int:
+        """Write several keys atomically; returns the new version"""
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for key, value in values.items():
+                conn.execute(
+                    'INSERT INTO state (key, value) VALUES (?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                    (key, json.dumps(value))
+                )
+            conn.execute('UPDATE meta SET version = version + 1 WHERE id = 0')
+            version = conn.execute('SELECT version FROM meta WHERE id = 0').fetchone()[0]
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return version
+
+    def increment(self, key: str) -> int:
+        """Atomically add one to an integer key; returns its new value"""
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+            value = (json.loads(row[0]) if row else 0) + 1
+            conn.execute(
+                'INSERT INTO state (key, value) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                (key, json.dumps(value))
+            )
+            conn.execute('UPDATE meta SET version = version + 1 WHERE id = 0')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return value
+
+
+class ChatHistory:
+    """Conversation history kept in the shared store, so every worker sees every session.
+
+    Chat turns are appended rows and don't bump the settings version. Only the
+    newest max_rows messages are kept (0 = no cap).
+    """
+
+    # Trim old rows once per this many appends rather than on every one
+    TRIM_EVERY = 100
+
+    def __init__(self, state: SharedState, max_rows: int = 0):
+        self.state = state
+        self.max_rows = max_rows
+
+    def append(self, session_id: str, item: Dict[str, Any]):
+        conn = self.state.connect()
+        row_id = conn.execute(
+            'INSERT INTO chat_history (session_id, item) VALUES (?, ?)',
+            (str(session_id), json.dumps(item))
+        ).lastrowid
+        if self.max_rows and row_id % self.TRIM_EVERY == 0:
+            conn.execute('DELETE FROM chat_history WHERE id <= ?', (row_id - self.max_rows,))
+
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        rows = self.state.connect().execute(
+            'SELECT item FROM chat_history WHERE session_id = ? ORDER BY id', (str(session_id),)
+        )
+        return [json.loads(item) for (item,) in rows]
+
+    def all(self) -> Dict[str, List[Dict[str, Any]]]:
+        """{session_id: [item, ...]}, sessions in order of their first message"""
+        sessions: Dict[str, List[Dict[str, Any]]] = {}
+        for session_id, item in self.state.connect().execute('SELECT session_id, item FROM chat_history ORDER BY id'):
+            sessions.setdefault(session_id, []).append(json.loads(item))
+        return sessions
+
+    def delete(self, session_id: str):
+        self.state.connect().execute('DELETE FROM chat_history WHERE session_id = ?', (str(session_id),))
+
+    def clear(self):
+        self.state.connect().execute('DELETE FROM chat_history')